@@ -0,0 +1,27 @@
+# magtorquer/_crc.py
+"""
+CRC‑8 used by the Hyperion Protocol framing (poly 0xEB, init 0x00,
+non‑reflected) – see Protocol §3.
+
+Shared by the driver and the stand-alone tools so the lookup table is
+built once per process.
+"""
+
+CRC8_POLY = 0xEB
+
+def _crc8_table_entry(byte: int) -> int:
+    crc = byte
+    for _ in range(8):
+        crc = ((crc << 1) ^ CRC8_POLY) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+CRC8_TABLE = bytes(_crc8_table_entry(i) for i in range(256))
+
+def crc8(buf: bytes, crc: int = 0) -> int:
+    """Table-driven CRC‑8 over ``buf`` (one lookup per byte), resuming from ``crc``."""
+    # Frames are only a few dozen bytes, so a JIT/NumPy kernel would spend more
+    # converting the buffer than it saves; keep the loop lean with locals instead.
+    table = CRC8_TABLE
+    for b in buf:
+        crc = table[crc ^ b]
+    return crc
@@ -1,4 +1,4 @@
-
+from bisect import bisect_right
 from typing import List, Tuple
 
 # --- Serial Port Configuration ---
@@ -29,4 +29,23 @@ POWER_LOOKUP_TABLE: List[Tuple[float, float]] = [
     (20000,  4.900),
     (25000,  7.200),
     (30000, 10.800),
-]
\ No newline at end of file
+]
+
+# Breakpoints and per-segment slopes, split out once so lookups are a bisect + one multiply.
+POWER_X: Tuple[float, ...] = tuple(float(m) for m, _ in POWER_LOOKUP_TABLE)
+POWER_Y: Tuple[float, ...] = tuple(float(w) for _, w in POWER_LOOKUP_TABLE)
+_POWER_SLOPES: Tuple[float, ...] = tuple(
+    (y1 - y0) / (x1 - x0) for x0, x1, y0, y1 in zip(POWER_X, POWER_X[1:], POWER_Y, POWER_Y[1:])
+)
+
+def power_for(mAm2: float) -> float:
+    """Expected power draw (W) at a dipole moment, linearly interpolated from POWER_LOOKUP_TABLE.
+
+    Power depends only on the magnitude of the moment, so the sign is ignored;
+    moments beyond the table clamp to its end values.
+    """
+    m = abs(mAm2)
+    if m <= POWER_X[0]: return POWER_Y[0]
+    if m >= POWER_X[-1]: return POWER_Y[-1]
+    i = bisect_right(POWER_X, m) - 1
+    return POWER_Y[i] + _POWER_SLOPES[i] * (m - POWER_X[i])
@@ -13,26 +13,39 @@ Date: June 2025
 
 from __future__ import annotations
 
+import binascii
 import logging
+import re
 import struct
-import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import Iterable, Optional
 
 import serial
-from crc import Calculator, Configuration
+
+from ._crc import CRC8_TABLE, crc8
 
 logger = logging.getLogger(__name__)
 
 # ----------------------- Protocol Constants -----------------------
 
-# CRC configuration (poly 0xEB, init 0x00, non‑reflected) – see Protocol §3
-_crc_cfg = Configuration(
-    width=8, polynomial=0xEB, init_value=0x00, final_xor_value=0x00,
-    reverse_input=False, reverse_output=False,
-)
-CRC_CALCULATOR = Calculator(_crc_cfg)
+# Uppercase ASCII hex pair for every byte value, e.g. _HEX2[0x3A] == b"3A".
+_HEX2 = tuple(f"{i:02X}".encode("ascii") for i in range(256))
+
+# '$' + src/dst/cmd/length header + even-length hex payload + ':' + CRC + '\n'
+_FRAME_RE = re.compile(rb"\$([0-9A-Fa-f]{10})((?:[0-9A-Fa-f]{2})*):([0-9A-Fa-f]{2})\n")
+
+# Pre-compiled payload layouts (all big-endian).
+_U8X4_BE = struct.Struct(">BBBB")
+_U16_BE  = struct.Struct(">H")
+_I16_BE  = struct.Struct(">h")
+_U32_BE  = struct.Struct(">I")
+_F32_BE  = struct.Struct(">f")
+
+# Largest response payload in the MTQ800.15 command set is 4 bytes; leave headroom.
+MAX_RESPONSE_PAYLOAD = 16
+# '$' + src/dst/cmd (6) + length (4) + payload (hex) + ':' + CRC (2) + '\n'
+MAX_RESPONSE_LEN = 1 + 6 + 4 + 2 * MAX_RESPONSE_PAYLOAD + 1 + 2 + 1
 
 # ----------------------- Data Types & Enums -----------------------
 
@@ -90,12 +103,24 @@ class MTQDriver:
     mtq_address: int
     timeout: float = 2.0
     serial_conn: Optional[serial.Serial] = None
+    _addr_prefix: bytes = field(default=b"", init=False, repr=False, compare=False)
+    _addr_crc: int = field(default=0, init=False, repr=False, compare=False)
+    _empty_pkt_cache: dict[int, bytes] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _safe_idle_pkt: bytes = field(default=b"", init=False, repr=False, compare=False)
+    _setpoint_pkt_cache: dict[int, bytes] = field(default_factory=dict, init=False, repr=False, compare=False)
 
     # --- Magic Methods & Connection Handling ---
     def __post_init__(self) -> None:
         for name, val in (("host_address", self.host_address), ("mtq_address", self.mtq_address)):
             if not (0 <= val <= 0xFF): raise ValueError(f"{name} {val:#x} out of 0x00‑0xFF range")
         if self.timeout <= 0: raise ValueError("timeout must be positive")
+        self._addr_prefix = f"{self.host_address:02X}{self.mtq_address:02X}".encode("ascii")
+        self._addr_crc = crc8(self._addr_prefix)
+        # Zero-payload frames depend only on (host, mtq, cmd): encode them once.
+        self._empty_pkt_cache = {cmd.value: self._encode_packet(cmd.value) for cmd in Command}
+        # Zero set-point followed by STOP, sent as one write on disconnect.
+        self._safe_idle_pkt = (self._encode_packet(Command.SET_DIPOLE_MOMENT_SETPOINT.value, _I16_BE.pack(0))
+                               + self._empty_pkt_cache[Command.STOP.value])
 
     def __enter__(self) -> "MTQDriver":
         self.connect()
@@ -106,7 +131,7 @@ class MTQDriver:
 
     def connect(self) -> None:
         if self.serial_conn and self.serial_conn.is_open: return
-        logger.info(f"Connecting to MTQ on {self.port} @ {self.baudrate} bps…")
+        logger.info("Connecting to MTQ on %s @ %s bps…", self.port, self.baudrate)
         try:
             self.serial_conn = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
             logger.info("Connection established.")
@@ -117,53 +142,90 @@ class MTQDriver:
         if self.serial_conn and self.serial_conn.is_open:
             logger.info("Ensuring MTQ is in a safe, idle state before disconnecting.")
             try:
-                self.set_dipole_moment(0.0)
-                self.stop()
-            except MTQCommunicationError as e:
-                logger.warning(f"Could not send final stop command: {e}")
+                logger.debug("TX -> %r", self._safe_idle_pkt)
+                self.serial_conn.write(self._safe_idle_pkt)
+                self.serial_conn.flush()
+            except serial.SerialException as e:
+                logger.warning("Could not send final stop command: %s", e)
             self.serial_conn.close()
             logger.info("Serial connection closed.")
         self.serial_conn = None
 
     # --- Core Protocol Layer (Internal Use) ---
     def _encode_packet(self, command_id: int, payload: bytes = b"") -> bytes:
-        len_field = len(payload).to_bytes(2, "big")
-        ascii_parts = (f"{self.host_address:02X}".encode("ascii"), f"{self.mtq_address:02X}".encode("ascii"), f"{command_id:02X}".encode("ascii"), len_field.hex().upper().encode("ascii"), payload.hex().upper().encode("ascii"))
-        body = b"".join(ascii_parts)
-        data_for_crc = body + b":"
-        crc = CRC_CALCULATOR.checksum(data_for_crc)
-        return b"$" + data_for_crc + f"{crc:02X}".encode("ascii") + b"\n"
+        buf = bytearray(b"$")
+        buf += self._addr_prefix
+        # Fold each ASCII pair into the CRC as it is appended: no second pass over the body.
+        crc, table = self._addr_crc, CRC8_TABLE
+        n = len(payload)
+        for b in (command_id, n >> 8, n & 0xFF, *payload):
+            pair = _HEX2[b]
+            buf += pair
+            crc = table[table[crc ^ pair[0]] ^ pair[1]]
+        buf += b":"
+        buf += _HEX2[table[crc ^ 0x3A]]  # CRC covers the ':' separator too
+        buf += b"\n"
+        return bytes(buf)
 
     def _decode_response(self, frame: bytes) -> tuple[int, int, int, bytes]:
-        if not frame.startswith(b"$") or not frame.endswith(b"\n") or b":" not in frame:
+        m = _FRAME_RE.fullmatch(frame)
+        if m is None:
             raise MTQCommunicationError(f"Malformed packet received: {frame!r}")
-        body_with_crc = frame[1:-1]
-        body, crc_ascii = body_with_crc.rsplit(b":", 1)
-        calculated_crc = CRC_CALCULATOR.checksum(body + b":")
+        header, payload_ascii, crc_ascii = m.groups()
+        calculated_crc = crc8(memoryview(frame)[1:m.end(2) + 1])
         received_crc = int(crc_ascii, 16)
         if calculated_crc != received_crc:
             raise MTQCommunicationError(f"CRC mismatch! (Got {received_crc:#04x}, want {calculated_crc:#04x})")
-        src, dst, cmd, length = int(body[0:2], 16), int(body[2:4], 16), int(body[4:6], 16), int(body[6:10], 16)
-        payload_ascii = body[10:]
+        src, dst, cmd, len_hi, len_lo = binascii.a2b_hex(header)
+        length = (len_hi << 8) | len_lo
         if len(payload_ascii) != length * 2: raise MTQCommunicationError("Payload length mismatch.")
-        return src, dst, cmd, bytes.fromhex(payload_ascii.decode("ascii")) if length else b""
+        return src, dst, cmd, binascii.a2b_hex(payload_ascii)
+
+    def _packet_for(self, command: Command, payload: bytes = b"") -> bytes:
+        return self._encode_packet(command.value, payload) if payload else self._empty_pkt_cache[command.value]
 
     def _transport(self, command: Command, payload: bytes = b"", *, expect_response: bool = True) -> Optional[bytes]:
+        return self._exchange(self._packet_for(command, payload), expect_response=expect_response)
+
+    def _exchange(self, pkt: bytes, *, expect_response: bool = True) -> Optional[bytes]:
         if not (self.serial_conn and self.serial_conn.is_open):
             raise MTQCommunicationError("Port not open.")
-        pkt = self._encode_packet(command.value, payload)
         logger.debug("TX -> %r", pkt)
         self.serial_conn.write(pkt)
-        self.serial_conn.flush()
-        time.sleep(0.05) # Allow time for the device to process the command
         if not expect_response: return None
-        resp = self.serial_conn.readline()
+        return self._read_response()
+
+    def _read_response(self) -> bytes:
+        resp = self.serial_conn.read_until(b"\n", MAX_RESPONSE_LEN)
         logger.debug("RX <- %r", resp)
         if not resp: raise MTQCommunicationError(f"Timeout from MTQ (Addr: {self.mtq_address:#04x})")
         src, _, _, resp_payload = self._decode_response(resp)
-        if src != self.mtq_address: logger.warning(f"Response from unexpected address {src:#04x}")
+        if src != self.mtq_address: logger.warning("Response from unexpected address %#04x", src)
         return resp_payload
 
+    # --- Batched Transport ---
+    def pipelined(self, *requests: tuple[bytes, bool]) -> list[Optional[bytes]]:
+        """Sends ``(frame, expect_response)`` entries in one write, then reads the
+        replies in order. Entries that expect no reply yield None.
+
+        Build frames with command_frame() / setpoint_frame()."""
+        if not (self.serial_conn and self.serial_conn.is_open):
+            raise MTQCommunicationError("Port not open.")
+        pkt = b"".join(frame for frame, _ in requests)
+        logger.debug("TX -> %r", pkt)
+        self.serial_conn.write(pkt)
+        return [self._read_response() if expect_response else None for _, expect_response in requests]
+
+    def command_frame(self, command: Command) -> bytes:
+        """Returns the encoded frame for a command that carries no payload."""
+        return self._empty_pkt_cache[command.value]
+
+    def setpoint_frame(self, mAm2: float | int) -> bytes:
+        """Returns the encoded SET_DIPOLE_MOMENT_SETPOINT frame (cached if precomputed)."""
+        mAm2_int = mAm2 if type(mAm2) is int else int(round(mAm2))
+        pkt = self._setpoint_pkt_cache.get(mAm2_int)
+        return pkt if pkt is not None else self._encode_setpoint_packet(mAm2_int)
+
     # ----------------------- High-Level API: General Hyperion Commands -----------------------
     def ping(self) -> None:
         """Sends a PING command to reset the device's watchdog timer."""
@@ -181,13 +243,22 @@ class MTQDriver:
         """Gets the hardware and software version of the device."""
         pl = self._transport(Command.IDENTIFY)
         if not pl: return None
-        ww, xx, yy, zz = struct.unpack(">BBBB", pl)
+        ww, xx, yy, zz = _U8X4_BE.unpack(pl)
         return IdentifyInfo(hw_version=f"{ww}.{xx}", sw_version=f"{yy}.{zz}")
 
     def get_serial_no(self) -> Optional[int]:
         """Gets the unique 32-bit serial number of the device."""
         pl = self._transport(Command.GET_SERIAL_NO)
-        return struct.unpack(">I", pl)[0] if pl else None
+        return _U32_BE.unpack(pl)[0] if pl else None
+
+    def get_mode(self) -> Optional[MTQMode]:
+        """Gets the current operating mode (IDLE, RUNNING, BRAKING or DEGAUSSING)."""
+        pl = self._transport(Command.GET_MODE)
+        if not pl: return None
+        try:
+            return MTQMode(int.from_bytes(pl, "big"))
+        except ValueError as e:
+            raise MTQCommunicationError(f"Unknown mode byte(s) {pl.hex()} from MTQ") from e
 
     # ----------------------- High-Level API: MTQ800.15 Specific Commands -----------------------
 
@@ -200,30 +271,36 @@ class MTQDriver:
         """Returns the on-chip temperature in Celsius."""
         pl = self._transport(Command.GET_TEMPERATURE)
         if not pl: return None
-        return (struct.unpack(">H", pl)[0] / 10.0) - 273.15
+        return (_U16_BE.unpack(pl)[0] / 10.0) - 273.15
 
     def set_dipole_moment(self, mAm2: float | int) -> None:
-            """ Set the desired magnetic dipole moment. """
-
-            mAm2_int = int(round(mAm2))
-            if not (-30_000 <= mAm2_int <= 30_000):
-                raise ValueError("dipole set‑point must be within ±30 000 mAm²")
-
-            payload = mAm2_int.to_bytes(2, "big", signed=True)   # 2‑byte payload
-            self._transport(Command.SET_DIPOLE_MOMENT_SETPOINT,
-                            payload,
-                            expect_response=False)
-
+        """ Set the desired magnetic dipole moment. """
+        self._exchange(self.setpoint_frame(mAm2), expect_response=False)
+
+    def precompute_setpoint_packets(self, levels: Iterable[float | int]) -> dict[int, bytes]:
+        """Pre-encodes SET_DIPOLE_MOMENT_SETPOINT packets for ``levels`` and returns them."""
+        packets: dict[int, bytes] = {}
+        for level in levels:
+            mAm2_int = int(round(level))
+            packets[mAm2_int] = self._encode_setpoint_packet(mAm2_int)
+        self._setpoint_pkt_cache.update(packets)
+        return packets
+
+    def _encode_setpoint_packet(self, mAm2_int: int) -> bytes:
+        if not (-30_000 <= mAm2_int <= 30_000):
+            raise ValueError("dipole set‑point must be within ±30 000 mAm²")
+        payload = _I16_BE.pack(mAm2_int)   # 2‑byte payload
+        return self._encode_packet(Command.SET_DIPOLE_MOMENT_SETPOINT.value, payload)
 
     def get_dipole_moment(self) -> Optional[int]:
         """Returns the currently measured dipole moment in mAm² as a signed 16-bit int."""
         pl = self._transport(Command.GET_DIPOLE_MOMENT)
-        return struct.unpack(">h", pl)[0] if pl else None
+        return _I16_BE.unpack(pl)[0] if pl else None
 
     def get_dipole_moment_setpoint(self) -> Optional[float]:
         """Returns the currently configured dipole moment setpoint as a float."""
         pl = self._transport(Command.GET_DIPOLE_MOMENT_SETPOINT)
-        return struct.unpack(">f", pl)[0] if pl else None
+        return _F32_BE.unpack(pl)[0] if pl else None
 
     # --- High-Level API: Mode Control Shorthands ---
     def start(self) -> None:
@@ -1,70 +1,124 @@
 #!/usr/bin/env python3
 import sys
 import time
+from functools import lru_cache
 
-from crc import Calculator, Configuration
-import serial
+from magtorquer._crc import crc8
 
+_HEX = b"0123456789ABCDEF"
+_WHOAMI_TEMPLATE = b"$....100000:..\n"
 
-crc_config = Configuration(
-    width=8,
-    polynomial=0xEB,
-    init_value=0x00,
-    final_xor_value=0x00,
-    reverse_input=False,
-    reverse_output=False,
-)
-crc_calc = Calculator(crc_config)
+
+@lru_cache(maxsize=None)
+def _host_prefix(host_addr: int) -> tuple[bytes, int]:
+    """ASCII host field and the CRC state after it, shared by every probe frame."""
+    prefix = f"{host_addr:02X}".encode('ascii')
+    return prefix, crc8(prefix)
 
 
 def build_whoami_frame(host_addr: int, node_addr: int) -> bytes:
 \
-    ascii_body = f"{host_addr:02X}{node_addr:02X}10" + "0000:"
-    data = ascii_body.encode('ascii')
-    crc_val = crc_calc.checksum(data)
-    return b'$' + data + f"{crc_val:02X}".encode('ascii') + b"\n"
+    prefix, prefix_crc = _host_prefix(host_addr)
+    # '$' host node cmd=10 len=0000 ':' crc '\n' -- only host, node and CRC vary.
+    buf = bytearray(_WHOAMI_TEMPLATE)
+    buf[1:3] = prefix
+    buf[3], buf[4] = _HEX[node_addr >> 4], _HEX[node_addr & 0xF]
+    crc_val = crc8(memoryview(buf)[3:12], prefix_crc)
+    buf[12], buf[13] = _HEX[crc_val >> 4], _HEX[crc_val & 0xF]
+    return bytes(buf)
+
+
+def print_reply(node: int, reply: bytes) -> None:
+    hex_dump = reply.hex(' ').upper()
+    try:
+        ascii_rep = reply.decode('ascii', errors='replace').strip()
+    except Exception:
+        ascii_rep = '<non-ASCII reply>'
+    print(f"Address 0x{node:02X} replied: {hex_dump}  ({ascii_rep})")
 
 
-def scan_addresses(port: str, baud: int, host: int, start: int, end: int) -> None:
+def reply_source(reply: bytes, host: int) -> int | None:
+    """Node address a reply frame came from, or None if it is not addressed to ``host``."""
+    if len(reply) < 5 or reply[:1] != b'$':
+        return None
+    try:
+        src, dst = int(reply[1:3], 16), int(reply[3:5], 16)
+    except ValueError:
+        return None
+    return src if dst == host else None
+
+
+def scan_one_at_a_time(ser, host: int, start: int, end: int) -> None:
+    ser.reset_input_buffer()
+    for node in range(start, end + 1):
+        ser.write(build_whoami_frame(host, node))
+        reply = ser.read_until(b"\n", 512)
+        if reply:
+            # Without a per-probe input flush a late reply can trail into the next probe.
+            src = reply_source(reply, host)
+            print_reply(node if src is None else src, reply)
+            break
+        else:
+            print(f"No reply from 0x{node:02X}")
+    else:
+        print("No devices responded in the specified range.")
+
+
+def scan_pipelined(ser, host: int, start: int, end: int, reply_window_s: float = 0.5) -> None:
+    """Send every probe in one write, then collect replies and match them by source address."""
+    frames = b"".join(build_whoami_frame(host, node) for node in range(start, end + 1))
+    expected = end - start + 1
+    ser.reset_input_buffer()
+    ser.write(frames)
+
+    # The last probe leaves the UART after ~10 bits per byte; allow a reply window on top.
+    deadline = time.monotonic() + len(frames) * 10 / ser.baudrate + reply_window_s
+    rx = bytearray()
+    replies: dict[int, bytes] = {}
+    while len(replies) < expected and time.monotonic() < deadline:
+        rx += ser.read(ser.in_waiting or 1)
+        while (nl := rx.find(b"\n")) >= 0:
+            reply = bytes(rx[:nl + 1])
+            del rx[:nl + 1]
+            node = reply_source(reply, host)
+            if node is not None and start <= node <= end:
+                replies.setdefault(node, reply)
+
+    for node in sorted(replies):
+        print_reply(node, replies[node])
+    if not replies:
+        print("No devices responded in the specified range.")
+
+
+def scan_addresses(port: str, baud: int, host: int, start: int, end: int, slow: bool = False) -> None:
 \
+    import serial  # deferred so usage errors don't pay for the import
+
     print(f"Scanning addresses 0x{start:02X} to 0x{end:02X} with host 0x{host:02X}...")
     try:
-        ser = serial.Serial(port, baud, timeout=0.5)
+        ser = serial.Serial(port, baud, timeout=0.1 if slow else 0.05, inter_byte_timeout=0.02)
     except Exception as e:
         print(f"Error opening {port}: {e}")
         sys.exit(1)
 
     with ser:
-        for node in range(start, end + 1):
-            frame = build_whoami_frame(host, node)
-            ser.reset_input_buffer()
-            ser.write(frame)
-            ser.flush()
-            time.sleep(0.05)
-            reply = ser.readline()
-            if reply:
-                hex_dump = ' '.join(f"{b:02X}" for b in reply)
-                try:
-                    ascii_rep = reply.decode('ascii', errors='replace').strip()
-                except Exception:
-                    ascii_rep = '<non-ASCII reply>'
-                print(f"Address 0x{node:02X} replied: {hex_dump}  ({ascii_rep})")
-                break
-            else:
-                print(f"No reply from 0x{node:02X}")
+        if slow:
+            scan_one_at_a_time(ser, host, start, end)
         else:
-            print("No devices responded in the specified range.")
+            scan_pipelined(ser, host, start, end)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python scan_addresses.py /dev/cu.usbserial-XXXX [baud] [host] [start] [end]")
+    slow = '--slow' in sys.argv[1:]
+    args = [sys.argv[0]] + [a for a in sys.argv[1:] if a != '--slow']
+    if len(args) < 2:
+        print("Usage: python scan_addresses.py /dev/cu.usbserial-XXXX [baud] [host] [start] [end] [--slow]")
         sys.exit(1)
 
-    port = sys.argv[1]
-    baud = int(sys.argv[2]) if len(sys.argv) >= 3 else 115200
-    host = int(sys.argv[3], 0) if len(sys.argv) >= 4 else 0x11
-    start = int(sys.argv[4], 0) if len(sys.argv) >= 5 else 0x00
-    end   = int(sys.argv[5], 0) if len(sys.argv) >= 6 else 0xFF
+    port = args[1]
+    baud = int(args[2]) if len(args) >= 3 else 115200
+    host = int(args[3], 0) if len(args) >= 4 else 0x11
+    start = int(args[4], 0) if len(args) >= 5 else 0x00
+    end   = int(args[5], 0) if len(args) >= 6 else 0xFF
 
-    scan_addresses(port, baud, host, start, end)
+    scan_addresses(port, baud, host, start, end, slow)
@@ -1,15 +1,87 @@
 #!/usr/bin/env python3
+import os
+import selectors
 import sys
 import threading
-import time
-import serial
+
+def emit_lines(buf: bytearray) -> None:
+    """Prints and removes every complete line held in ``buf``."""
+    while (nl := buf.find(b"\n")) >= 0:
+        print("RX:", buf[:nl + 1].hex(' ').upper())
+        del buf[:nl + 1]
+
+
+def flush_partial(buf: bytearray) -> None:
+    """Shows whatever partial line is pending once the line has gone quiet."""
+    if buf:
+        print("RX:", buf.hex(' ').upper())
+        buf.clear()
+
+
+def send_line(ser, line: str) -> bool:
+    """Sends one console line; returns False when the user asked to quit."""
+    line = line.strip("\r\n")
+    if not line:
+        return True
+    if line.lower().strip() in ("exit", "quit"):
+        return False
+    send = line.encode("ascii") + b"\n"
+    ser.write(send)
+    print("TX:", send.hex(' ').upper())
+    return True
+
+
+def console_loop(ser, idle_s: float = 1.0) -> None:
+    """Single-threaded console: multiplex the port and stdin with a selector (POSIX)."""
+    sel = selectors.DefaultSelector()
+    buf, typed = bytearray(), bytearray()
+    try:
+        sel.register(ser.fileno(), selectors.EVENT_READ, "ser")
+        sel.register(sys.stdin.fileno(), selectors.EVENT_READ, "stdin")
+        print("TX> ", end="", flush=True)
+        while True:
+            events = sel.select(timeout=idle_s)
+            if not events:
+                flush_partial(buf)
+            for key, _ in events:
+                if key.data == "ser":
+                    buf += ser.read(ser.in_waiting or 1)
+                    emit_lines(buf)
+                else:
+                    # Raw reads so several pasted lines are not stranded in a stdio buffer.
+                    data = os.read(key.fd, 4096)
+                    if not data:
+                        return
+                    typed += data
+                    while (nl := typed.find(b"\n")) >= 0:
+                        line = typed[:nl].decode("ascii", errors="ignore")
+                        del typed[:nl + 1]
+                        if not send_line(ser, line):
+                            return
+                        print("TX> ", end="", flush=True)
+    finally:
+        sel.close()
+
 
 def reader(ser):
 \
+    buf = bytearray()
     while True:
-        line = ser.readline() 
-        if line:
-            print("RX:", ' '.join(f"{b:02X}" for b in line))
+        chunk = ser.read(ser.in_waiting or 1)
+        if not chunk:
+            # Read timed out: show whatever partial line is pending.
+            flush_partial(buf)
+            continue
+        buf += chunk
+        emit_lines(buf)
+
+
+def threaded_loop(ser) -> None:
+    """Fallback for platforms where stdin cannot be selected on (Windows)."""
+    t = threading.Thread(target=reader, args=(ser,), daemon=True)
+    t.start()
+    while send_line(ser, input("TX> ")):
+        pass
 
 
 def main():
@@ -20,6 +92,8 @@ def main():
     port = sys.argv[1]
     baud = int(sys.argv[2]) if len(sys.argv) >= 3 else 115200
 
+    import serial  # deferred so usage errors don't pay for the import
+
     try:
         ser = serial.Serial(port, baud, timeout=1)
     except Exception as e:
@@ -27,20 +101,17 @@ def main():
         sys.exit(1)
 
 
-    print(f"Opened {port} @ {baud} bps.")
-    t = threading.Thread(target=reader, args=(ser,), daemon=True)
-    t.start()
+    print(f"Opened {port} @ {baud} bps.")
     try:
-        while True:
-            line = input("TX> ")
-            if not line:
-                continue
-            if line.lower().strip() in ("exit", "quit"):
-                break
-            send = line.encode("ascii") + b"\n"
-            ser.write(send)
-            print("TX:", ' '.join(f"{b:02X}" for b in send))
-    except KeyboardInterrupt:
+        if os.name == "posix":
+            try:
+                console_loop(ser)
+            except PermissionError:
+                # epoll refuses regular files, e.g. stdin redirected from a file.
+                threaded_loop(ser)
+        else:
+            threaded_loop(ser)
+    except (KeyboardInterrupt, EOFError):
         pass
     finally:
         ser.close()
@@ -2,62 +2,75 @@
 import logging
 import time
 
-from magtorquer.mtq_driver import MTQDriver, MTQCommunicationError
+from magtorquer.mtq_driver import MTQDriver, MTQCommunicationError, MTQMode
 from magtorquer.logging_config import setup_logging
 from magtorquer.config_mtq import SERIAL_PORT, BAUD_RATE, HOST_ADDRESS, MTQ_ADDRESS, SERIAL_TIMEOUT
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
+def _wait_until(pred, timeout: float = 2.0, dt: float = 0.02) -> bool:
+    """Polls ``pred`` until it returns True or ``timeout`` seconds have passed."""
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < timeout:
+        if pred():
+            return True
+        time.sleep(dt)
+    return False
+
+def _moment_within(driver: MTQDriver, target: float, tolerance: float) -> bool:
+    """True once a moment was read back and lies within ``tolerance`` of ``target``."""
+    moment = driver.get_dipole_moment()
+    return moment is not None and abs(moment - target) <= tolerance
+
 def main():
     """Test setting the dipole moment and controlling the device mode."""
-    driver = MTQDriver(SERIAL_PORT, BAUD_RATE, HOST_ADDRESS, MTQ_ADDRESS, SERIAL_TIMEOUT)
-    
     # Dipole moment to test with
     test_dipole_moment = 5000.0  # mAm^2
+    # Allow for some tolerance in the measurement
+    tolerance = 100.0
 
     try:
-        driver.connect()
-
-        logger.info("--- Ensuring device is in IDLE mode ---")
-        driver.stop()
-        time.sleep(0.5)
-
-        logger.info(f"--- Setting dipole moment to {test_dipole_moment} mAm² ---")
-        driver.set_dipole_moment(test_dipole_moment)
-        time.sleep(0.5)
-
-        logger.info("--- Starting device (activating coil) ---")
-        driver.start()
-        time.sleep(1) # Wait for the current to stabilize
-
-        logger.info("--- Reading back measured dipole moment ---")
-        measured_moment = driver.get_dipole_moment()
-        if measured_moment is not None:
-            # Check if the measured value is close to the setpoint
-            # Allow for some tolerance in the measurement
-            tolerance = 100.0 
-            if abs(measured_moment - test_dipole_moment) <= tolerance:
-                logger.info(f"Set/Get Dipole Test: PASSED (Set: {test_dipole_moment}, Got: {measured_moment})")
+        with MTQDriver(
+            SERIAL_PORT, BAUD_RATE, HOST_ADDRESS, MTQ_ADDRESS, SERIAL_TIMEOUT
+        ) as driver:
+            logger.info("--- Ensuring device is in IDLE mode ---")
+            driver.stop()
+            if not _wait_until(lambda: driver.get_mode() == MTQMode.IDLE):
+                logger.warning("Device did not report IDLE mode")
+
+            logger.info("--- Setting dipole moment to %s mAm² ---", test_dipole_moment)
+            driver.set_dipole_moment(test_dipole_moment)
+
+            logger.info("--- Starting device (activating coil) ---")
+            driver.start()
+            # Wait for the current to stabilize: poll until the reading settles near the setpoint
+            _wait_until(lambda: driver.get_mode() == MTQMode.RUNNING)
+            _wait_until(lambda: _moment_within(driver, test_dipole_moment, tolerance))
+
+            logger.info("--- Reading back measured dipole moment ---")
+            measured_moment = driver.get_dipole_moment()
+            if measured_moment is not None:
+                # Check if the measured value is close to the setpoint
+                if abs(measured_moment - test_dipole_moment) <= tolerance:
+                    logger.info("Set/Get Dipole Test: PASSED (Set: %s, Got: %s)", test_dipole_moment, measured_moment)
+                else:
+                    logger.error("Set/Get Dipole Test: FAILED - value out of tolerance (Set: %s, Got: %s)", test_dipole_moment, measured_moment)
+            else:
+                logger.error("Set/Get Dipole Test: FAILED - could not read back moment")
+
+            logger.info("--- Stopping device ---")
+            driver.stop()
+            _wait_until(lambda: _moment_within(driver, 0.0, tolerance))
+
+            final_moment = driver.get_dipole_moment()
+            if final_moment is not None and abs(final_moment) <= tolerance:
+                 logger.info("Stop Test: PASSED (Dipole moment near zero: %s mAm²)", final_moment)
             else:
-                logger.error(f"Set/Get Dipole Test: FAILED - value out of tolerance (Set: {test_dipole_moment}, Got: {measured_moment})")
-        else:
-            logger.error("Set/Get Dipole Test: FAILED - could not read back moment")
-
-        logger.info("--- Stopping device ---")
-        driver.stop()
-        time.sleep(0.5)
-        
-        final_moment = driver.get_dipole_moment()
-        if final_moment is not None and abs(final_moment) < 100.0:
-             logger.info(f"Stop Test: PASSED (Dipole moment near zero: {final_moment} mAm²)")
-        else:
-             logger.error(f"Stop Test: FAILED (Dipole moment not near zero: {final_moment} mAm²)")
+                 logger.error("Stop Test: FAILED (Dipole moment not near zero: %s mAm²)", final_moment)
 
     except MTQCommunicationError as e:
-        logger.error(f"A communication error occurred: {e}")
-    finally:
-        driver.disconnect()
+        logger.error("A communication error occurred: %s", e)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
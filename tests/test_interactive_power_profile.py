@@ -8,42 +8,59 @@ import sys, pathlib
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
 import csv
 import logging
+import operator
 import time
 import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import Iterator
 
-import plotly.graph_objects as go
 import serial
 
-from magtorquer.mtq_driver import MTQDriver, MTQCommunicationError
+from magtorquer.mtq_driver import Command, MTQDriver, MTQCommunicationError
 from magtorquer.config_mtq import (
     SERIAL_PORT, BAUD_RATE, SERIAL_TIMEOUT, HOST_ADDRESS, MTQ_ADDRESS,
-    TEST_LEVELS_MAM2, STABILIZATION_DELAY_S, RECOMMENDED_MAX_MAM2,
+    TEST_LEVELS_MAM2, STABILIZATION_DELAY_S, RECOMMENDED_MAX_MAM2, power_for,
 )
 
 # Logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)-8s - %(message)s")
 logger = logging.getLogger("power_test")
 
-# Background watchdog‑ping thread
-class WatchdogPatter(threading.Thread):
-    """Keeps the watchdog alive with periodic PINGs."""
-
-    def __init__(self, driver: MTQDriver, stop_event: threading.Event, interval_s: float = 4.0):
-        super().__init__(daemon=True)
-        self.driver, self.stop_event, self.interval = driver, stop_event, interval_s
-        self.name = "WatchdogPatter"
-
-    def run(self) -> None:  
-        logger.debug("Watchdog thread started.")
-        while not self.stop_event.wait(self.interval):
+# Background watchdog pings
+@contextmanager
+def watchdog_pings(drv: MTQDriver, interval_s: float = 4.0) -> Iterator[None]:
+    """Keeps the watchdog alive with periodic PINGs from a self-rearming timer."""
+    lock = threading.Lock()
+    active = True
+    timer: threading.Timer | None = None
+
+    def _arm() -> None:
+        nonlocal timer
+        timer = threading.Timer(interval_s, _ping_and_rearm)
+        timer.daemon = True
+        timer.start()
+
+    def _ping_and_rearm() -> None:
+        with lock:
+            if not active:
+                return
             try:
-                self.driver.ping()
+                drv.ping()
             except MTQCommunicationError as exc:  # pragma: no cover  (env‑specific)
                 logger.warning("Background ping failed: %s", exc)
-        logger.debug("Watchdog thread stopped.")
+            _arm()
+
+    with lock:
+        _arm()
+    try:
+        yield
+    finally:
+        with lock:
+            active = False
+            timer.cancel()
 
 # Data container
 @dataclass(slots=True)
@@ -65,15 +82,30 @@ def prompt_power_reading(setpoint: int) -> float:
 
 # Plotting
 
-def plot_results(results: list[TestResult]) -> None:
-    # Sort results so the line is monotonic left→right
-    results = sorted(results, key=lambda r: r.measured_moment_Am2)
+# Static figure layout, built once at import rather than on every plot.
+_PLOT_LAYOUT = dict(
+    title="MTQ800.15 – Power vs Dipole Moment",
+    xaxis_title="Measured Dipole Moment (Am²)",
+    yaxis_title="Power Consumption (W)",
+    template="plotly_white",
+    font=dict(size=16, family="Arial"),
+    margin=dict(l=80, r=40, t=80, b=60),
+)
+
+def plot_results(results: list[TestResult], png: bool = False) -> None:
+    import plotly.graph_objects as go  # deferred: only needed once data exists
 
-    x = [r.measured_moment_Am2 for r in results]
-    y = [r.measured_watts       for r in results]
-    labels = [f"{w:.2f} W"      for w in y]   # ← new
+    # Sort results so the line is monotonic left→right, then split both series in one pass
+    x: list[float] = []
+    y: list[float] = []
+    y_max = 0.0
+    for r in sorted(results, key=operator.attrgetter("measured_moment_mAm2")):
+        x.append(r.measured_moment_Am2)
+        y.append(r.measured_watts)
+        y_max = max(y_max, r.measured_watts)
+    labels = [f"{w:.2f} W" for w in y]
 
-    fig = go.Figure()
+    fig = go.Figure(layout=_PLOT_LAYOUT)
     fig.add_trace(go.Scatter(
         x=x,
         y=y,
@@ -90,7 +122,7 @@ def plot_results(results: list[TestResult]) -> None:
     # Nominal‑max vertical line (converted to Am²)
     v_nom = RECOMMENDED_MAX_MAM2 / 1_000.0
     fig.add_vline(x=v_nom, line_width=2, line_dash="dash", line_color="green")
-    fig.add_annotation(x=v_nom, y=max(y)*0.5, text="Nominal&nbsp;Max", showarrow=True,
+    fig.add_annotation(x=v_nom, y=y_max*0.5, text="Nominal&nbsp;Max", showarrow=True,
                       arrowhead=1, ax=-60, ay=-40, font=dict(color="green"))
 
     # Saturation detection: if last three points within ±2 %, draw a horizontal line.
@@ -99,39 +131,33 @@ def plot_results(results: list[TestResult]) -> None:
         fig.add_hline(y=sat_y, line_dash="dot", line_color="red",
                       annotation_text="Dipole saturation", annotation_position="top left")
 
-    fig.update_layout(
-        title="MTQ800.15 – Power vs Dipole Moment",
-        xaxis_title="Measured Dipole Moment (Am²)",
-        yaxis_title="Power Consumption (W)",
-        template="plotly_white",
-        font=dict(size=16, family="Arial"),
-        margin=dict(l=80, r=40, t=80, b=60),
-    )
-
-    out_png = Path("mtq_power_profile.png")
-    try:
-        fig.write_image(out_png, width=1000, height=600, scale=2)
-        logger.info("Saved curve → %s", out_png)
-    except Exception as exc:  # pragma: no cover  (env‑specific)
-        logger.warning("Could not write PNG (need 'kaleido' ororca). Error: %s", exc)
+    # PNG export starts a headless browser via kaleido; only pay for it on request.
+    if png:
+        out_png = Path("mtq_power_profile.png")
+        try:
+            fig.write_image(out_png, width=1000, height=600, scale=2)
+            logger.info("Saved curve → %s", out_png)
+        except Exception as exc:  # pragma: no cover  (env‑specific)
+            logger.warning("Could not write PNG (need 'kaleido' ororca). Error: %s", exc)
     fig.show()
 
 # CSV archiving
 
+_CSV_ROW = operator.attrgetter("setpoint_mAm2", "measured_moment_mAm2", "measured_watts")
+
 def save_csv(results: list[TestResult]) -> Path:
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     path = Path(f"power_profile_{ts}.csv")
     with path.open("w", newline="") as fh:
         writer = csv.writer(fh)
         writer.writerow(["setpoint_mAm2", "measured_moment_mAm2", "measured_watts"])
-        for r in results:
-            writer.writerow([r.setpoint_mAm2, r.measured_moment_mAm2, r.measured_watts])
+        writer.writerows(map(_CSV_ROW, results))
     logger.info("Logged raw measurements → %s", path)
     return path
 
 # Main interactive routine
 
-def run_test() -> None:
+def run_test(png: bool = False) -> None:
     print("\n" + "="*78)
     print("MTQ800.15 Interactive Power Profile Test")
     print("(Watchdog is pinged in background – you can take your time.)")
@@ -140,8 +166,13 @@ def run_test() -> None:
     results: list[TestResult] = []
     try:
         with MTQDriver(SERIAL_PORT, BAUD_RATE, HOST_ADDRESS, MTQ_ADDRESS, SERIAL_TIMEOUT) as drv:
-            drv.stop(); drv.set_dipole_moment(0.0)
-            if not drv.who_am_i():
+            drv.precompute_setpoint_packets(TEST_LEVELS_MAM2)
+            *_, ident = drv.pipelined(
+                (drv.command_frame(Command.STOP), False),
+                (drv.setpoint_frame(0), False),
+                (drv.command_frame(Command.WHO_AM_I), True),
+            )
+            if not ident:
                 logger.error("MTQ did not respond to WHO_AM_I – aborting.")
                 return
 
@@ -154,10 +185,10 @@ def run_test() -> None:
                 meas = drv.get_dipole_moment() or 0
                 logger.info("Device reports %.0f mAm²", meas)
 
-                stop_evt = threading.Event(); patter = WatchdogPatter(drv, stop_evt)
-                patter.start()
-                pwr = prompt_power_reading(sp)
-                stop_evt.set(); patter.join()
+                with watchdog_pings(drv):
+                    pwr = prompt_power_reading(sp)
+                logger.info("Measured %.2f W vs %.2f W expected from the ICD table",
+                            pwr, power_for(meas))
 
                 results.append(TestResult(sp, meas, pwr))
 
@@ -170,9 +201,9 @@ def run_test() -> None:
     finally:
         if results:
             save_csv(results)
-            plot_results(results)
+            plot_results(results, png=png)
         else:
             logger.warning("No data collected – nothing to plot.")
 
 if __name__ == "__main__":
-    run_test()
+    run_test(png="--png" in sys.argv[1:])